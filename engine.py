@@ -1,5 +1,15 @@
 from game import C4Board
 
+try:
+    import search_nb
+except ImportError: # Numba is optional, without it the pure-Python search is used
+    search_nb = None
+
+# Transposition table entry flags
+EXACT = 0 # The stored value is the exact evaluation of the position
+LOWERBOUND = 1 # The search failed high (beta cutoff), so the position is worth at least the stored value
+UPPERBOUND = 2 # The search failed low (no move beat alpha), so the position is worth at most the stored value
+
 class C4Engine:
     """
     Moves are integers from lowest column (0) to highest column (num_cols - 1), default (6).
@@ -11,12 +21,18 @@ class C4Engine:
     + 3 for player 2 win
     """
     # int to evaluation integer
+    _EVAL_TABLE = (0, 0, 100, -100) # Indexed by board result: none yet, draw, player 1 win, player 2 win
     
-    def __init__(self):
+    def __init__(self, verbose: bool = False):
         """
         This engine is instance-based so that it can use a transposition table.
+        Entries are (value, depth, flag, best_move) tuples keyed by `board.key()`.
+        
+        If `verbose` is True, `bestmoves` prints the evaluation of each column and the number of ttable lookups after each search.
         """
+        self.verbose = verbose
         self.ttable = {}
+        self._nb_ttable = None # Separate transposition table for the Numba search, created on first use
         self._lookups = 0
         
         self.PLY_LIMIT = 10
@@ -26,22 +42,58 @@ class C4Engine:
         Returns a list of integers representing the columns where the player should move
         """
         
-        currfen = board.get_fen()
         evals = {}
+        flags = {} # EXACT, or UPPERBOUND for columns that were only searched far enough to show they are worse than the best
         
-        self.lookups = 0
+        self._lookups = 0
         
-        # Search down each of the columns
-        for col in board.all_available_moves():
-            board.make_move_at_column(col)
-            
-            eval = -self.negamax(board, -100, 100, 0)
+        # Saved so the board can be put back after each column is searched
+        snap = board.snapshot()
+        
+        # Try the center columns first, since they take part in the most lines
+        moves = [col for col in board._col_orders[-1] if board._heights[col] < board.size[1]]
+        
+        # Use the compiled search when we can
+        negamax = self.negamax_nb if search_nb is not None and search_nb.fits(board) else self.negamax
+        
+        # Iterative deepening: each search fills the transposition table with best moves,
+        # which are then tried first in the next (deeper) search so that alpha-beta cuts off sooner
+        for depth in range(1, self.PLY_LIMIT + 1):
+            best_eval = None
             
-            board.set_position(currfen)
+            # Evaluations of the positions searched so far in this iteration, keyed by the smaller of the position's key and its mirror's.
+            # A position and its mirror image have the same evaluation, so when the board is symmetric (like an empty board)
+            # only one of each mirrored pair of columns needs to be searched.
+            searched = {}
             
-            print(f"Move @ \x1b[32mColumn {col}\x1b[0m: \x1b[33m{eval}\x1b[0m")
+            # Search down each of the columns
+            for col in moves:
+                board.make_move_at_column(col)
+                
+                key = min(board.key(), board.mirror_key())
+                
+                if key in searched:
+                    eval, flag = searched[key]
+                else:
+                    # Once one column has been evaluated, the others only need to be searched far enough to tell whether
+                    # they are at least as good, so anything below best_eval - 1 is cut off
+                    alpha = -100 if best_eval is None else best_eval - 1
+                    eval = -negamax(board, -100, -alpha, 1, depth)
+                    
+                    # If the search failed low, the column is worth at most eval (it may be even worse)
+                    flag = UPPERBOUND if eval <= alpha else EXACT
+                    searched[key] = (eval, flag)
+                
+                board.restore(snap)
+                
+                evals[col] = eval
+                flags[col] = flag
+                
+                if best_eval is None or eval > best_eval:
+                    best_eval = eval
             
-            evals[col] = eval
+            # Search the best columns from this iteration first in the next one
+            moves.sort(key=lambda col: evals[col], reverse=True)
             
         # Loop through and find moves that resulted in the best evaluation (here, they are the highest scoring moves)
         max_eval = max(evals.values())
@@ -49,55 +101,150 @@ class C4Engine:
         # Find the indices of the max_eval
         indicies = [i for i in evals.keys() if evals.get(i) is not None and evals.get(i) == max_eval]
         
-        print(f"Lookups this search: \x1b[33m{self._lookups}\x1b[0m")
+        # Print everything at once after the search, so that writing to the terminal doesn't hold it up
+        if self.verbose:
+            lines = [f"Move @ \x1b[32mColumn {col}\x1b[0m: \x1b[33m{'<= ' if flags[col] == UPPERBOUND else ''}{evals[col]}\x1b[0m" for col in moves]
+            lines.append(f"Lookups this search: \x1b[33m{self._lookups}\x1b[0m")
+            print("\n".join(lines))
         self._lookups = 0
         
         return indicies
     
-    def negamax(self, board: C4Board, alpha: int, beta: int, ply: int) -> int:
-        # print(f"[Negamax] Searching at depth \x1b[34m{ply}\x1b[0m ply...")
+    def negamax(self, board: C4Board, alpha: int, beta: int, ply: int, depth: int) -> int:
         """
-        Returns the evaluation for the player whose turn it is to move.
+        Returns the evaluation for the player whose turn it is to move, searching `depth` more plies.
+        `ply` is the number of plies from the root of the search.
         Uses an evaluation-based scheme: 100 for positive result (win on this side), -100 for negative result (loss on this side), 0 for draw.
+        Wins and losses are moved towards 0 by the number of plies it takes to reach them, so faster wins and slower losses score better.
         """
         
-        if ply >= self.PLY_LIMIT:
-            return self.evaluate_position(board)
-        
-        if board.get_result() >= 2: # meaning there is a winner
-            return -100
-        
-        if board.get_result() == 1:            
-            # Add the board to the transposition table
-            return 0 # draw
+        # The search runs in the nested function below, which reads everything it needs at every node from local (closure) variables.
+        # Those are much faster to read than attributes, which matters when this runs millions of times in pure Python.
+        # These stay valid for the whole search, since making, undoing and restoring moves update the board's lists in place.
+        ttable_get = self.ttable.get
+        ttable_set = self.ttable.__setitem__
+        evaluate_position = self.evaluate_position
+        board_key = board.key
+        make_move = board.make_move_at_column
+        delete_move = board.delete_move_at_column
+        col_orders = board._col_orders
+        heights = board._heights
+        rows = board.size[1]
+        lookups = 0
         
-        # return ttable evaluation if it exists
-        ttable_eval = self.ttable.get(board.get_fen())
-        if ttable_eval is not None:
-            self._lookups += 1
-            return ttable_eval
-        
-        best_value = -100
-        
-        for move in board.all_available_moves():
-            # Move here is a zero-indexed column number
+        def search(alpha: int, beta: int, ply: int, depth: int) -> int:
+            nonlocal lookups
+            
+            result = board._result
             
-            currfen = board.get_fen()
-            board.make_move_at_column(move)
-            value = -self.negamax(board, -beta, -alpha, ply + 1)    
-            board.set_position(currfen)
+            if result >= 2: # meaning there is a winner
+                return -(100 - ply)
             
-            best_value = max(best_value, value)
-            alpha = max(alpha, value)
+            if result == 1:
+                return 0 # draw
             
+            if depth <= 0:
+                return evaluate_position(board)
+            
+            # Mate-distance pruning: the best we can do from here is win with our next move, and the worst is
+            # to lose on the opponent's next move, so nothing outside that window can change the result
+            alpha = max(alpha, -(98 - ply))
+            beta = min(beta, 99 - ply)
             if alpha >= beta:
-                break
+                return alpha
+            
+            alpha_orig = alpha
+            
+            # The children are undone before we store, so this is still the key for this position then
+            key = board_key()
+            
+            # Use the ttable entry if it was searched at least as deep as we need to search
+            ttable_move = -1
+            ttable_entry = ttable_get(key)
+            if ttable_entry is not None:
+                ttable_value, ttable_depth, ttable_flag, ttable_move = ttable_entry
+                
+                # Wins and losses are stored as plies from this position (see below), so convert back to plies from the root
+                if ttable_value > 0:
+                    ttable_value -= ply
+                elif ttable_value < 0:
+                    ttable_value += ply
+                
+                if ttable_depth >= depth:
+                    if ttable_flag == EXACT:
+                        lookups += 1
+                        return ttable_value
+                    elif ttable_flag == LOWERBOUND:
+                        alpha = max(alpha, ttable_value)
+                    else:
+                        beta = min(beta, ttable_value)
+                        
+                    if alpha >= beta:
+                        lookups += 1
+                        return ttable_value
+            
+            best_value = -100
+            best_move = -1
+            
+            # Try the best move from a previous search first (if there is one), then the rest from the center outwards
+            for move in col_orders[ttable_move]:
+                # Move here is a zero-indexed column number
+                
+                if heights[move] == rows:
+                    continue
+                
+                make_move(move)
+                value = -search(-beta, -alpha, ply + 1, depth - 1)
+                delete_move(move)
+                
+                if best_move == -1 or value > best_value:
+                    best_value = value
+                    best_move = move
+                    
+                alpha = max(alpha, value)
+                
+                if alpha >= beta:
+                    break
+                
+            # Store the result in the transposition table, remembering whether it is exact or only a bound
+            if best_value <= alpha_orig:
+                flag = UPPERBOUND
+            elif best_value >= beta:
+                flag = LOWERBOUND
+            else:
+                flag = EXACT
+                
+            # The same position can be reached at a different distance from the root in a later search,
+            # so wins and losses are stored as plies from this position rather than from the root
+            if best_value > 0:
+                ttable_value = best_value + ply
+            elif best_value < 0:
+                ttable_value = best_value - ply
+            else:
+                ttable_value = 0
+                
+            ttable_set(key, (ttable_value, depth, flag, best_move))
             
-        # Store the result in the transposition table
-        self.ttable[board.get_fen()] = best_value
+            return best_value
+        
+        value = search(alpha, beta, ply, depth)
+        self._lookups += lookups
+        
+        return value
 
-        return best_value           
+    def negamax_nb(self, board: C4Board, alpha: int, beta: int, ply: int, depth: int) -> int:
+        """
+        Same as `negamax`, but runs the Numba-compiled search from search_nb.py.
+        Only usable when Numba is installed and `search_nb.fits(board)`.
+        """
+        
+        if self._nb_ttable is None:
+            self._nb_ttable = search_nb.new_ttable()
+        
+        value, lookups = search_nb.negamax(board, alpha, beta, ply, depth, self._nb_ttable)
+        self._lookups += lookups
         
+        return value
 
     def evaluate_position(self, board: C4Board) -> int:
         """
@@ -106,14 +253,4 @@ class C4Engine:
         Currently just returns based on board result
         """
         
-        match board.get_result():
-            case 0:
-                return 0
-            case 1:
-                return 0
-            case 2:
-                return 100
-            case 3:
-                return -100
-            case _:
-                return 0
\ No newline at end of file
+        return self._EVAL_TABLE[board.get_result()]
\ No newline at end of file
@@ -3,23 +3,62 @@ class C4Board:
     Represents a 7-column, 6-row, gravity-affected, 2-player Connect Four board.
     """
     
+    # Orders to try the columns in when searching, cached per number of columns. Center columns come first, since they take part in the most lines.
+    # For a board with `cols` columns, _COL_ORDERS[cols][col] is that order with `col` moved to the front,
+    # and _COL_ORDERS[cols][-1] (one past the last column) is the plain order.
+    _COL_ORDERS = {}
+    
+    # Translations between a FEN column (1 for Player 1, 2 for Player 2) and Player 2's bits in that column
+    _FEN_TO_BITS = str.maketrans("12", "01")
+    _BITS_TO_FEN = str.maketrans("01", "12")
+    
     def __init__(self, cols: int = 7, rows: int = 6, connect_num: int = 4):
         """
         Initializes a new C4Board object with an empty board and no winner.
         """
         
-        # Board squares are None, False for Player 1, True for Player 2.
-        # We actually represent columns as lists. When len(col) == 6, the column is full.
-        # Index 0 of each of these columns is the bottom of the column.
-        self._board = [[] for i in range(cols)]
+        # The board is stored as two bitboards, one per player (index 0 for Player 1, index 1 for Player 2).
+        # Each column takes up (rows + 1) bits, and bit 0 of a column is the bottom of that column.
+        # The extra bit on top of each column is always empty, so pieces in neighbouring columns never line up.
+        # Square (col, row) is therefore bit number col * (rows + 1) + row.
+        self._bb = [0, 0]
+        self._heights = [0] * cols # Number of pieces in each column. When _heights[col] == rows, the column is full.
+        self._stride = rows + 1
+        self._num_pieces = 0 # Total number of pieces on the board. When it reaches cols * rows, the board is full.
+        self._bottom = sum(1 << (col * self._stride) for col in range(cols)) # The bottom square of every column, used by `key`
+        self._top = self._bottom << (rows - 1) # The top square of every column, which is only filled when the column is full
         self.size = (cols, rows)
         self.connect_num = connect_num
         self._result = 0 # 0 for none yet, 1 for draw, 2 for player 1 win, 3 for player 2 win
         self._win_reason = 0 # 0 for none yet, 1 for horizontal, 2 for vertical, 3 for diagonal
-        self._turn = False # Start with Player 1's turn
+        self._turn = 0 # 0 for Player 1's turn, 1 for Player 2's turn. Start with Player 1's turn
         
         self.win_locs = [] # List of (x, y) tuples of the winning locations
         
+        if cols not in self._COL_ORDERS:
+            order = tuple(sorted(range(cols), key=lambda col: abs(col - cols // 2)))
+            self._COL_ORDERS[cols] = tuple((col,) + tuple(c for c in order if c != col) for col in range(cols)) + (order,)
+        self._col_orders = self._COL_ORDERS[cols]
+        
+        # The shifts `_check_win` uses to find connect_num in a row, worked out once here so that it doesn't have to.
+        # Shifting by 1 moves along a column (vertical), shifting by rows + 1 moves along a row (horizontal),
+        # and shifting by rows or rows + 2 moves along the two diagonals.
+        # The empty bit on top of each column stops runs from wrapping around into the next column.
+        self._win_shifts = []
+        for direction in (1, self._stride - 1, self._stride, self._stride + 1):
+            # Double the run length while we can, then join two overlapping runs to reach exactly connect_num
+            shifts = []
+            length = 1
+            
+            while length * 2 <= connect_num:
+                shifts.append(direction * length)
+                length *= 2
+                
+            if length < connect_num:
+                shifts.append(direction * (connect_num - length))
+                
+            self._win_shifts.append(tuple(shifts))
+        
     def __str__(self) -> str:
         return self.to_string()
 
@@ -27,10 +66,32 @@ class C4Board:
         """
         Returns a hash of the board.
         """
-        boardstate = [tuple(col) for col in self._board]
-        boardstate.append(self._turn)
         
-        return hash(tuple(boardstate))
+        return hash(self.key())
+    
+    def __eq__(self, other) -> bool:
+        """
+        Returns True if both boards are the same size and have the same pieces and player to move.
+        """
+        
+        if not isinstance(other, C4Board):
+            return NotImplemented
+        
+        return self._bb == other._bb and self._turn == other._turn and self.size == other.size
+
+    @property
+    def _board(self) -> list:
+        """
+        Returns the board as a list of columns, where each column is a list of pieces (False for Player 1, True for Player 2).
+        Index 0 of each column is the bottom of the column.
+        
+        This is rebuilt from the bitboards on every access, so it should only be used for display.
+        """
+        
+        bb = self._bb[1]
+        stride = self._stride
+        
+        return [[bool(bb >> (col * stride + row) & 1) for row in range(height)] for col, height in enumerate(self._heights)]
 
     def make_move_at_column(self, col: int) -> bool:
         """
@@ -43,18 +104,23 @@ class C4Board:
         if (col < 0 or col >= self.size[0]):
             return False
         
+        height = self._heights[col]
+        
         # Check if column is full
-        if len(self._board[col]) == self.size[1]:
+        if height == self.size[1]:
             return False
         
-        # Otherwise, "drop" a piece into the column (append to the list)
-        self._board[col].append(self._turn)
+        # Otherwise, "drop" a piece into the column (set the lowest empty bit of the column)
+        square = col * self._stride + height
+        self._bb[self._turn] ^= 1 << square
+        self._heights[col] = height + 1
+        self._num_pieces += 1
         
         # Change turns
-        self._turn = not self._turn
+        self._turn ^= 1
         
-        # Check for winner
-        self.check_result()
+        # Check for winner (only the player who just moved can have made a new line)
+        self.check_result(self._turn ^ 1)
         
         return True
     
@@ -63,16 +129,23 @@ class C4Board:
         Removes the topmost piece from the specified column. Zero-indexed (0 for leftmost col, 6 for rightmost col).
         Returns True if the move is able to be undone (column is not empty), False otherwise.
         
-        This function is provided assuming that it will be only be called with the correct column number.
+        This function is provided assuming that it will be only be called with the correct column number,
+        i.e. to undo the last move made on the board.
         """
         
-        if len(self._board[col]) == 0:
+        height = self._heights[col]
+        
+        if height == 0:
             return False
         
-        self._board[col].pop()
+        height -= 1
+        self._heights[col] = height
+        self._num_pieces -= 1
         
-        # Change turns back
-        self._turn = not self._turn
+        # Change turns back, then take the piece away from the player who placed it
+        self._turn ^= 1
+        square = col * self._stride + height
+        self._bb[self._turn] ^= 1 << square
         
         # Remove result
         self._result = 0
@@ -83,6 +156,22 @@ class C4Board:
         
         return True
     
+    def snapshot(self) -> tuple:
+        """
+        Returns a tuple holding the full state of the board, which can be passed to `restore` later.
+        Much cheaper than saving and restoring a FEN string.
+        """
+        
+        return (self._bb[0], self._bb[1], tuple(self._heights), self._turn, self._num_pieces, self._result)
+    
+    def restore(self, snap: tuple) -> None:
+        """
+        Restores the board to the state saved by `snapshot`.
+        """
+        
+        # Update the lists in place rather than replacing them, in case something is holding on to them (like a running search)
+        self._bb[0], self._bb[1], self._heights[:], self._turn, self._num_pieces, self._result = snap
+    
     def p1_won(self) -> bool:
         """
         Returns True if Player 1 has won, False otherwise.
@@ -134,29 +223,25 @@ class C4Board:
         `1 12 2 11 211 2 2 2`
         """
         
-        self._board = []
-        self._turn = int(fen[-1]) == 2
+        self._bb = [0, 0]
+        self._turn = int(int(fen[-1]) == 2)
         
-        fen = fen[:-2]
-         
-        # Parse into chunks
-        chunks = fen.split(" ")
+        # Parse into chunks. The FEN starts from the rightmost column, so go through them backwards
+        chunks = fen[:-2].split(" ")
+        self._heights = [len(chunk) for chunk in reversed(chunks)]
         
-        for chunk in chunks:
-            if chunk == '':
-                self._board.append([])
+        for col, chunk in enumerate(reversed(chunks)):
+            if not chunk:
                 continue
             
-            self._board.append([])
+            # Each chunk lists its column bottom first, so reversed and with Player 2's pieces as 1s it is that player's bits in binary
+            p2_bits = int(chunk[::-1].translate(self._FEN_TO_BITS), 2)
+            p1_bits = ((1 << len(chunk)) - 1) ^ p2_bits
             
-            for char in chunk:
-                if char == '1':
-                    self._board[-1].append(False)
-                elif char == '2':
-                    self._board[-1].append(True)
-                    
-        # Reverse the board
-        self._board.reverse()                        
+            self._bb[0] |= p1_bits << (col * self._stride)
+            self._bb[1] |= p2_bits << (col * self._stride)
+        
+        self._num_pieces = sum(self._heights)
     
     def get_fen(self) -> str:
         """
@@ -188,19 +273,17 @@ class C4Board:
         `1 12 2 11 211 2 2 2`
         """
         
-        chunks = []
+        stride = self._stride
+        
+        # The reverse of how `set_position` reads a chunk: Player 2's bits in the column, written in binary bottom first.
+        # A 1 is put just above the top piece so that the leading 0s are kept, and then cut off again by the slice
+        chunks = [format(((self._bb[1] >> (col * stride)) & ((1 << height) - 1)) | (1 << height), "b")[:0:-1] for col, height in enumerate(self._heights)]
         
-        for _list in self._board:
-            chunk = []
-            for item in _list:
-                chunk.append("2" if item else "1")
-            chunks.append("".join(chunk))
-            
         # Reverse chunks due to how board is stored
         chunks.reverse()
         
         # add the turn        
-        return " ".join(chunks) + " " + ("2" if self._turn else "1")
+        return " ".join(chunks).translate(self._BITS_TO_FEN) + " " + ("2" if self._turn else "1")
     
     def set_turn(self, player_num: int) -> None:
         """
@@ -208,7 +291,7 @@ class C4Board:
         1 is by default the first player.
         """
         
-        self._turn = player_num == 2
+        self._turn = int(player_num == 2)
         
     def get_turn(self) -> int:
         """
@@ -217,9 +300,39 @@ class C4Board:
         
         return 2 if self._turn else 1
     
-    def check_result(self):
+    def key(self) -> int:
+        """
+        Returns an integer that uniquely identifies the position (John Tromp's Fhourstones position key).
+        
+        Adding one to the bottom of each column turns the column's occupied squares into a single bit just above its top piece,
+        and the squares below that bit hold the pieces of the player to move. Whose turn it is follows from the number of pieces.
+        """
+        
+        return self._bb[self._turn] | ((self._bb[0] | self._bb[1]) + self._bottom)
+    
+    def mirror_key(self) -> int:
+        """
+        Returns the `key` of this position flipped left to right.
+        A position and its mirror image always have the same evaluation.
+        """
+        
+        # Every column of the key only depends on that column, so the key can be flipped directly
+        key = self.key()
+        cols = self.size[0]
+        stride = self._stride
+        col_mask = (1 << stride) - 1
+        
+        mirrored = 0
+        for col in range(cols):
+            mirrored |= ((key >> (col * stride)) & col_mask) << ((cols - 1 - col) * stride)
+            
+        return mirrored
+    
+    def check_result(self, player: int = None):
         """
         Internal function that scans the board to check for a winner (4 in a row diagonally, vertically, or horizontally).
+        If `player` is given (0 for Player 1, 1 for Player 2), only that player's pieces are checked for a win,
+        which is all that is needed right after they make a move.
         
         This sets `self._result` as follows:
         0 for no result yet
@@ -228,82 +341,34 @@ class C4Board:
         3 for player 2 win        
         """
         
-        # If board is full, it's a draw
-        if all(len(col) == self.size[1] for col in self._board):
+        if player != 1 and self._check_win(self._bb[0]):
+            self._result = 2
+        elif player != 0 and self._check_win(self._bb[1]):
+            self._result = 3
+        # If board is full (and nobody has won), it's a draw
+        elif self._num_pieces == self.size[0] * self.size[1]:
             self._result = 1
-            return
-        
-        # Check for win along a diagonal (probably the most common)
-        # This should similar to checking along a row, but we need to check both directions of diagonal
-        # And we also can cut some of the board off since we can't have a diagonal win in the first (connect_num - 1) rows
-        # or the last (connect_num - 1) rows
-        
-        # top left to bottom right diagonals
-        for i in range(self.size[0] - self.connect_num + 1):
-            # For each element in those lists, check connect_num spaces below it
-            for j in range(len(self._board[i]) - self.connect_num + 1):
-                # Check if all of those elements are the same
-                if (
-                len(self._board[i]) > j and
-                len(self._board[i + 1]) > j + 1 and
-                len(self._board[i + 2]) > j + 2 and
-                len(self._board[i + 3]) > j + 3 and
-                self._board[i][j] == self._board[i + 1][j + 1] == self._board[i + 2][j + 2] == self._board[i + 3][j + 3]):
-                    self._result = 3 if self._board[i][j] else 2 if self._board[i][j] == False else 0
-                    #self._win_reason = 3
-                    #self.win_locs = f"BOARD:\n{self._board}\n>> Winning indxs: {[(i, j), (i + 1, j + 1), (i + 2, j + 2), (i + 3, j + 3)]}"
-                    return
-                    
-        # top right to bottom left diagonals
-        for i in range(self.size[0] - self.connect_num + 1):
-            # For each element in those lists, check connect_num spaces below it
-            for j in range(self.connect_num - 1, len(self._board[i])):
-                # Check if all of those elements are the same
-                if (
-                len(self._board[i]) > j and
-                len(self._board[i + 1]) > j-1 and
-                len(self._board[i + 2]) > j-2 and
-                len(self._board[i + 3]) > j-3 and    
-                self._board[i][j] == self._board[i + 1][j - 1] == self._board[i + 2][j - 2] == self._board[i + 3][j - 3]):
-                    self._result = 3 if self._board[i][j] else 2 if self._board[i][j] == False else 0
-                    #self._win_reason = 3
-                    #self.win_locs = f"BOARD:\n{self._board}\n>> Winning indxs: {[(i, j), (i + 1, j - 1), (i + 2, j - 2), (i + 3, j - 3)]}"
-                    return
-        
-        # Check for win along a row (second most common)
-        # We need to check the beginnings of chains in the top (col - connect_num + 1) lists
-        for i in range(self.size[0] - self.connect_num + 1):
-            # For each element in those lists, check connect_num spaces below it
-            for j in range(len(self._board[i])):
-                # Check if all of those elements are the same
-                if (
-                len(self._board[i]) > j and
-                len(self._board[i + 1]) > j and
-                len(self._board[i + 2]) > j and
-                len(self._board[i + 3]) > j and
-                self._board[i][j] == self._board[i + 1][j] == self._board[i + 2][j] == self._board[i + 3][j]):
-                    
-                    self._result = 3 if self._board[i][j] else 2 if self._board[i][j] == False else 0
-                    #self._win_reason = 1
-                    #self.win_locs = [(i, j), (i + 1, j), (i + 2, j), (i + 3, j)]
-                    return
-        
-        # Check for win along a column (least common since people just drop pieces)
-        # Loop through each column
-        for col in range(len(self._board)):
-            if (len(self._board[col]) < self.connect_num):
-                continue
-            
-            for piece in range(len(self._board[col]) - self.connect_num + 1):
-                if (self._board[col][piece] == self._board[col][piece + 1] == self._board[col][piece + 2] == self._board[col][piece + 3]):
-                    self._result = 3 if self._board[col][piece] else 2 if self._board[col][piece] == False else 0
-                    #self._win_reason = 2
-                    #self.win_locs = f"BOARD: \n{self._board}\n Column idx {col}, col={self._board[col]}, @position {piece}"
-                    return
-                
-        self._result = 0
+        else:
+            self._result = 0
         #self._win_reason = 0
         #self.win_locs = []
+        
+    def _check_win(self, bb: int) -> bool:
+        """
+        Internal function that returns True if the bitboard `bb` has `connect_num` pieces in a row in any direction.
+        """
+        
+        # Each bit of y marks the start of a run of pieces, and every shift makes the runs longer (see `_win_shifts` in __init__)
+        for shifts in self._win_shifts:
+            y = bb
+            
+            for shift in shifts:
+                y &= y >> shift
+            
+            if y:
+                return True
+            
+        return False
 
     def get_result(self) -> int:
         """
@@ -323,7 +388,16 @@ class C4Board:
         Example return: `[0, 1, 2, 3, 4, 6]` when columns 5 is full.
         """
         
-        return [i for i in range(self.size[0]) if len(self._board[i]) < self.size[1]]
+        # Columns whose top square is still empty, lowest column first
+        top = ~(self._bb[0] | self._bb[1]) & self._top
+        moves = []
+        
+        while top:
+            bit = top & -top
+            moves.append((bit.bit_length() - 1) // self._stride)
+            top ^= bit
+            
+        return moves
     
     def to_string(self) -> str:
         
@@ -343,6 +417,7 @@ class C4Board:
         """
         
         string = ""
+        board = self._board
         # Remember that colums are stored as lists, so we need to print the board in an inverted way
         
         if self._turn == False: # Player 1's turn
@@ -352,9 +427,9 @@ class C4Board:
             
         for row in range(self.size[1] - 1, -1, -1):
             for col in range(self.size[0]):
-                if len(self._board[col]) <= row:
+                if len(board[col]) <= row:
                     string += "| "
-                elif self._board[col][row] == False:
+                elif board[col][row] == False:
                     string += "|\x1b[33m1\x1b[0m"
                 else:
                     string += "|\x1b[31m2\x1b[0m"
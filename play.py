@@ -49,7 +49,7 @@ def collect_game_settings() -> tuple:
 
 def run_game():
     
-    goldfish = C4Engine()
+    goldfish = C4Engine(verbose=True)
     
     num_cols, num_rows, connect_num = collect_game_settings()
     print(f"Game parameter types: {type(num_cols)}, {type(num_rows)}, {type(connect_num)}")
@@ -0,0 +1,178 @@
+"""
+Numba-compiled version of `C4Engine.negamax`, used by the engine when Numba is installed.
+
+The board is passed in as plain integers and numpy arrays instead of a C4Board,
+so the whole search runs as machine code without going back into Python.
+"""
+
+import numpy as np
+from numba import njit, types
+from numba.typed import Dict
+
+def fits(board) -> bool:
+    """
+    Returns True if the board's bitboards fit in a signed 64-bit integer, which the compiled search needs.
+    """
+
+    return board.size[0] * board._stride <= 63
+
+def new_ttable() -> Dict:
+    """
+    Returns an empty transposition table for the compiled search.
+    Entries are packed into one integer by `_pack_entry` and keyed by `C4Board.key()`.
+    """
+
+    return Dict.empty(key_type=types.int64, value_type=types.int64)
+
+def negamax(board, alpha: int, beta: int, ply: int, depth: int, ttable: Dict) -> tuple:
+    """
+    Runs the compiled search on the board, which is left unchanged.
+    Returns a tuple of (evaluation, number of transposition table lookups).
+    """
+
+    lookups = np.zeros(1, dtype=np.int64)
+
+    value = _negamax(
+        np.array(board._bb, dtype=np.int64),
+        np.array(board._heights, dtype=np.int64),
+        board._turn,
+        board._num_pieces,
+        alpha, beta, ply, depth,
+        board.size[1], board._stride, board.connect_num, board._bottom,
+        np.array(board._col_orders[-1], dtype=np.int64),
+        ttable,
+        lookups,
+    )
+
+    return value, lookups[0]
+
+@njit(cache=True)
+def _pack_entry(value, depth, flag, move):
+    # value is between -100 and 100, depth and flag are small and non-negative, move is -1 for none
+    return ((value + 128) << 24) | (depth << 16) | (flag << 8) | (move + 1)
+
+@njit(cache=True)
+def _check_win(bb, stride, connect_num):
+    # Same shift-AND test as C4Board._check_win
+    for shift in (1, stride - 1, stride, stride + 1):
+        y = bb
+        length = 1
+
+        while length * 2 <= connect_num:
+            y &= y >> (shift * length)
+            length *= 2
+
+        if length < connect_num:
+            y &= y >> (shift * (connect_num - length))
+
+        if y:
+            return True
+
+    return False
+
+@njit(cache=True)
+def _negamax(bb, heights, turn, num_pieces, alpha, beta, ply, depth,
+             rows, stride, connect_num, bottom, move_order, ttable, lookups):
+    # Mirrors C4Engine.negamax; see there for the details of each step.
+    # bb and heights are modified while searching, but are back to how they started when this returns.
+
+    # Only the player who just moved can have won
+    if _check_win(bb[turn ^ 1], stride, connect_num):
+        return -(100 - ply)
+
+    if num_pieces == len(heights) * rows:
+        return 0 # draw
+
+    if depth <= 0:
+        return 0 # static evaluation, see C4Engine.evaluate_position
+
+    # Mate-distance pruning
+    alpha = max(alpha, -(98 - ply))
+    beta = min(beta, 99 - ply)
+    if alpha >= beta:
+        return alpha
+
+    alpha_orig = alpha
+
+    # Same as C4Board.key
+    key = bb[turn] | ((bb[0] | bb[1]) + bottom)
+
+    ttable_move = -1
+    if key in ttable:
+        entry = ttable[key]
+        ttable_value = (entry >> 24) - 128
+        ttable_depth = (entry >> 16) & 255
+        ttable_flag = (entry >> 8) & 255
+        ttable_move = (entry & 255) - 1
+
+        if ttable_value > 0:
+            ttable_value -= ply
+        elif ttable_value < 0:
+            ttable_value += ply
+
+        if ttable_depth >= depth:
+            if ttable_flag == 0: # EXACT
+                lookups[0] += 1
+                return ttable_value
+            elif ttable_flag == 1: # LOWERBOUND
+                alpha = max(alpha, ttable_value)
+            else: # UPPERBOUND
+                beta = min(beta, ttable_value)
+
+            if alpha >= beta:
+                lookups[0] += 1
+                return ttable_value
+
+    best_value = -100
+    best_move = -1
+
+    # Index -1 is the best move from the ttable, then the rest from the center outwards
+    for i in range(-1, len(move_order)):
+        if i == -1:
+            move = ttable_move
+            if move == -1:
+                continue
+        else:
+            move = move_order[i]
+            if move == ttable_move:
+                continue
+
+        if heights[move] == rows:
+            continue
+
+        square = move * stride + heights[move]
+        bb[turn] ^= np.int64(1) << square
+        heights[move] += 1
+
+        value = -_negamax(bb, heights, turn ^ 1, num_pieces + 1, -beta, -alpha, ply + 1, depth - 1,
+                          rows, stride, connect_num, bottom, move_order, ttable, lookups)
+
+        heights[move] -= 1
+        bb[turn] ^= np.int64(1) << square
+
+        if best_move == -1 or value > best_value:
+            best_value = value
+            best_move = move
+
+        alpha = max(alpha, value)
+
+        if alpha >= beta:
+            break
+
+    if best_value <= alpha_orig:
+        flag = 2 # UPPERBOUND
+    elif best_value >= beta:
+        flag = 1 # LOWERBOUND
+    else:
+        flag = 0 # EXACT
+
+    if best_value > 0:
+        ttable_value = best_value + ply
+    elif best_value < 0:
+        ttable_value = best_value - ply
+    else:
+        ttable_value = 0
+
+    ttable[key] = _pack_entry(ttable_value, depth, flag, best_move)
+
+    return best_value